@@ -371,6 +371,15 @@ class Executor:  # pylint:disable=too-many-instance-attributes
         if self.test_regex["skipped"].match(line):
             self._finished(current_test, "SKIPPED")
 
+    @property
+    def identifier(self):
+        """Identifier of the test directory to execute this test in.
+
+        :return: Test directory identifier.
+        :rtype: str
+        """
+        return " ".join(self.checkout_command)
+
     def execute(self, workspace):
         """Execute a test case.
 
@@ -379,7 +388,7 @@ class Executor:  # pylint:disable=too-many-instance-attributes
         """
         line = False
         with workspace.test_directory(
-            " ".join(self.checkout_command),
+            self.identifier,
             self._checkout_tests,
             self.checkout_command,
             workspace.workspace,
@@ -18,6 +18,7 @@ import logging
 import traceback
 import time
 from copy import deepcopy
+from functools import partial
 from pathlib import Path
 from shutil import make_archive, rmtree
 from json.decoder import JSONDecodeError
@@ -43,6 +44,8 @@ class LogArea:
         self.log_area = self.etos.config.get("test_config").get("log_area")
         self.logs = []
         self.artifacts = []
+        # Names given to collected files which may not have been uploaded yet.
+        self.collected_names = set()
 
     @property
     def persistent_logs(self):
@@ -89,12 +92,13 @@ class LogArea:
             )
             filename = filename[: 250 - len(path.suffix)] + path.suffix
             self.logger.info("Result: %r", filename)
-        log_names = [item["name"] for item in self.logs + self.artifacts]
+        log_names = self.collected_names.union(item["name"] for item in self.logs + self.artifacts)
         index = 0
         while filename in log_names:
             index += 1
             filename = f"{index}_{filename}"
             self.logger.info("Log name already exists. Rename to %r.", filename)
+        self.collected_names.add(filename)
         return path.rename(directory.joinpath(filename))
 
     def collect(self, path):
@@ -111,7 +115,7 @@ class LogArea:
         for item in path.iterdir():
             if item.is_dir():
                 compressed_item = make_archive(
-                    item.relative_to(Path.cwd()),
+                    item,
                     format="gztar",
                     root_dir=path,
                     base_dir=item.name,
@@ -155,7 +159,7 @@ class LogArea:
             identity = f"pkg:etos-test-output/{self.suite_name}"
         file_information = []
         for artifact in artifacts:
-            file_information.append({"name": artifact["file"].name})
+            file_information.append({"name": artifact["name"]})
         return self.etos.events.send_artifact_created_event(
             identity,
             fileInformation=file_information,
@@ -181,6 +185,22 @@ class LogArea:
             links={"CONTEXT": self.etos.config.get("context")},
         )
 
+    def _published_url(self, folder):
+        """Get the URL where artifacts in a log area folder are published.
+
+        :param folder: Folder in log area that artifacts were uploaded to.
+        :type folder: str
+        :return: URL to the published directory.
+        :rtype: str
+        """
+        upload = deepcopy(self.log_area.get("upload"))
+        data = {
+            "context": self.etos.config.get("context"),
+            "folder": folder,
+            "name": "",
+        }
+        return upload["url"].format(**data)
+
     def upload_artifacts(self, artifacts):
         """Upload artifacts to log area.
 
@@ -207,28 +227,57 @@ class LogArea:
             self.artifacts.append(artifact)
             artifact["file"].unlink()
 
-        upload = deepcopy(self.log_area.get("upload"))
-        data = {
-            "context": self.etos.config.get("context"),
-            "folder": log_area_folder,
-            "name": "",
-        }
-        published_url = upload["url"].format(**data)
-        self._artifact_published(artifact_created, published_url)
+        self._artifact_published(artifact_created, self._published_url(log_area_folder))
 
-    def __upload(self, context, log, name, folder):
-        """Upload log to a storage location.
+    def upload_stream(self, name, stream, completed=None, content_type=None):
+        """Upload an artifact from a stream to log area, without storing it on disk.
+
+        The artifact is only announced as created and published if the upload succeeds.
+        A stream cannot be rewound so, unlike files, a failed upload is not retried.
+
+        :param name: Name of the artifact to upload.
+        :type name: str
+        :param stream: Binary stream to read the artifact from, e.g. stdout of a subprocess.
+        :type stream: file
+        :param completed: Called after the stream has been uploaded. Shall return whether
+                          the stream was complete. Incomplete streams are not published.
+        :type completed: callable
+        :param content_type: Content-Type of the stream. Headers in the log area
+                             configuration take precedence.
+        :type content_type: str
+        :return: Whether or not the artifact was uploaded.
+        :rtype: bool
+        """
+        log_area_folder = (
+            f"{self.etos.config.get('main_suite_id')}/{self.etos.config.get('sub_suite_id')}"
+        )
+        self.logger.info("Uploading artifact %r to log area from stream", name)
+        uri = self.__upload_stream(
+            self.etos.config.get("context"), stream, name, log_area_folder, content_type
+        )
+        if uri is None:
+            return False
+        if completed is not None and not completed():
+            self.logger.error("Stream for %r was incomplete. Not publishing it.", name)
+            return False
+        artifact = {"name": name, "uri": uri}
+        artifact_created = self._artifact_created([artifact])
+        self.artifacts.append(artifact)
+
+        self._artifact_published(artifact_created, self._published_url(log_area_folder))
+        return True
+
+    def __upload_arguments(self, context, name, folder):
+        """Get the HTTP request arguments for uploading a file to log area.
 
         :param context: Context for the http request.
         :type context: str
-        :param log: Path to the log to upload.
-        :type log: str
         :param name: Name of file to upload.
         :type name: str
         :param folder: Folder to upload to.
         :type folder: str
-        :return: URI where log was uploaded to.
-        :rtype: str
+        :return: Request arguments for the upload.
+        :rtype: dict
         """
         upload = deepcopy(self.log_area.get("upload"))
         data = {"context": context, "name": name, "folder": folder}
@@ -240,6 +289,63 @@ class LogArea:
         upload["timeout"] = upload.get("timeout", 30)
         if upload.get("auth"):
             upload["auth"] = self.__auth(**upload["auth"])
+        return upload
+
+    def __upload_stream(
+        self, context, stream, name, folder, content_type=None
+    ):  # pylint:disable=too-many-arguments
+        """Upload a stream, in chunks, to a storage location.
+
+        :param context: Context for the http request.
+        :type context: str
+        :param stream: Binary stream to upload.
+        :type stream: file
+        :param name: Name of file to upload.
+        :type name: str
+        :param folder: Folder to upload to.
+        :type folder: str
+        :param content_type: Content-Type of the stream, unless set in the log area config.
+        :type content_type: str
+        :return: URI where stream was uploaded to or None if the upload failed.
+        :rtype: str
+        """
+        upload = self.__upload_arguments(context, name, folder)
+        verb = upload.pop("verb")
+        url = upload.pop("url")
+        as_json = upload.pop("as_json", True)
+        # The timeout is used for retrying file uploads and not for the request itself.
+        upload.pop("timeout")
+        if content_type is not None:
+            upload["headers"] = {"Content-Type": content_type, **upload.get("headers", {})}
+        chunks = iter(partial(stream.read, 1 << 20), b"")
+        try:
+            response = self.etos.http.request(verb, url, as_json, data=chunks, **upload)
+            self.logger.debug("%r", response)
+            self.logger.info("Uploaded stream %r.", name)
+            self.logger.info("Upload URI          %r", url)
+        except:  # noqa pylint:disable=bare-except
+            self.logger.error("%r", traceback.format_exc())
+            self.logger.error("Failed to upload stream!")
+            self.logger.error("Attempted upload of %r", name)
+            return None
+        return url
+
+    def __upload(self, context, log, name, folder):
+        """Upload log to a storage location.
+
+        :param context: Context for the http request.
+        :type context: str
+        :param log: Path to the log to upload.
+        :type log: str
+        :param name: Name of file to upload.
+        :type name: str
+        :param folder: Folder to upload to.
+        :type folder: str
+        :return: URI where log was uploaded to.
+        :rtype: str
+        """
+        upload = self.__upload_arguments(context, name, folder)
+        data = {"context": context, "name": name, "folder": folder}
 
         with open(log, "rb") as log_file:
             for _ in range(3):
@@ -100,10 +100,12 @@ class TestRunner:
         :rtype: bool
         """
         recipes = self.config.get("recipes")
+        executors = [Executor(test, self.iut, self.etos) for test in recipes]
+        workspace.preallocate([executor.identifier for executor in executors])
         result = True
-        for num, test in enumerate(recipes):
+        for num, executor in enumerate(executors):
             self.logger.info("Executing test %s/%s", num + 1, len(recipes))
-            with Executor(test, self.iut, self.etos) as executor:
+            with executor:
                 self.logger.info("Starting test '%s'", executor.test_name)
                 executor.execute(workspace)
 
@@ -14,20 +14,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """ETR workspace module."""
-from os import chdir, environ
+import os
+import gzip
 import logging
+import subprocess
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from functools import partial
 from tempfile import mkdtemp
 from pathlib import Path
-from shutil import make_archive
+from shutil import copyfileobj, which
 
+ENVIRONMENT_KEYS = ("TEST_ARTIFACT_PATH", "ARTIFACT_PATH", "LOG_PATH")
 
-class Workspace:
+
+class Workspace:  # pylint:disable=too-many-instance-attributes
     """Test runner workspace. This is where all testing is done."""
 
     logger = logging.getLogger(__name__)
     workspace = None
     compressed_workspace = None
+    _relative_workspace = None
+    _full_log = None
+    _in_context = False
 
     def __init__(self, log_area):
         """Initialize workspace with a dictionary of identifiers.
@@ -39,43 +49,113 @@ class Workspace:
 
         self.top_dir = Path.cwd()
         self.identifiers = {}
+        self._collected_dirs = {}
+        self._preallocated = set()
+        self._global_dirs_created = False
 
         self.global_logs = self.top_dir.joinpath("logs")
         self.global_artifacts = self.top_dir.joinpath("artifacts")
-        environ["GLOBAL_LOGS"] = str(self.global_logs)
-        environ["GLOBAL_ARTIFACTS"] = str(self.global_artifacts)
+        os.environ["GLOBAL_LOGS"] = str(self.global_logs)
+        os.environ["GLOBAL_ARTIFACTS"] = str(self.global_artifacts)
 
     def __enter__(self, path=None):
         """Create and chdir to a workspace."""
         self.workspace = Path(path) if path else self.top_dir.joinpath("workspace")
-        self.logger.info(
-            "Creating workspace directory %r", self.workspace.relative_to(self.top_dir)
-        )
+        self._relative_workspace = self.workspace.relative_to(self.top_dir)
+        self.logger.info("Creating workspace directory %r", self._relative_workspace)
         self.workspace.mkdir(exist_ok=True)
-        self.global_logs.mkdir(exist_ok=True)
-        self.global_artifacts.mkdir(exist_ok=True)
-        self.logger.info(
-            "Changing directory to workspace %r",
-            self.workspace.relative_to(self.top_dir),
-        )
-        chdir(self.workspace)
+        if not self._global_dirs_created:
+            self.global_logs.mkdir(exist_ok=True)
+            self.global_artifacts.mkdir(exist_ok=True)
+            self._global_dirs_created = True
+        # The full execution log is opened on the first test report and kept open
+        # until the workspace context exits.
+        self._in_context = True
+        self.logger.info("Changing directory to workspace %r", self._relative_workspace)
+        os.chdir(self.workspace)
         return self
 
     def __exit__(self, _type, _value, _traceback):
         """Compress and cleanup workspace."""
         self.logger.info("Returning to %r", self.top_dir)
-        chdir(self.top_dir)
-        self.compress()
-        self.log_area.upload_logs(self.log_area.collect(self.global_logs))
-        self.log_area.upload_artifacts(self.log_area.collect(self.global_artifacts))
-        self.log_area.upload_artifacts(
-            [
-                {
-                    "name": self.compressed_workspace.name,
-                    "file": self.compressed_workspace,
-                }
-            ]
-        )
+        os.chdir(self.top_dir)
+        self._in_context = False
+        if self._full_log is not None:
+            os.close(self._full_log)
+            self._full_log = None
+        self._upload(self.global_logs, self.global_artifacts, upload_workspace=True)
+
+    def _upload(self, log_path, artifact_path, upload_workspace=False):
+        """Collect logs and artifacts and upload them to the log area in parallel.
+
+        :param log_path: Path to collect logs from.
+        :type log_path: :obj:`pathlib.Path`
+        :param artifact_path: Path to collect artifacts from.
+        :type artifact_path: :obj:`pathlib.Path`
+        :param upload_workspace: Whether or not to also compress and upload the workspace.
+        :type upload_workspace: bool
+        """
+        # Collecting reserves a unique name for each file in the log area and is
+        # not thread-safe. Only the uploads are done in parallel.
+        logs = []
+        if self._nonempty(log_path):
+            logs = self.log_area.collect(log_path)
+        artifacts = []
+        if self._nonempty(artifact_path):
+            artifacts = self.log_area.collect(artifact_path)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            uploads = []
+            if upload_workspace:
+                uploads.append(executor.submit(self.upload_compressed))
+            if logs:
+                uploads.append(executor.submit(self.log_area.upload_logs, logs))
+            if artifacts:
+                uploads.append(executor.submit(self.log_area.upload_artifacts, artifacts))
+        for upload in uploads:
+            upload.result()
+
+    @staticmethod
+    def _nonempty(path):
+        """Check whether a directory has any entries, without walking all of it.
+
+        :param path: Directory to check.
+        :type path: :obj:`pathlib.Path`
+        :return: Whether or not the directory exists and is not empty.
+        :rtype: bool
+        """
+        try:
+            with os.scandir(path) as entries:
+                return next(entries, None) is not None
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _sendfile(source, destination):
+        """Copy a file in-kernel, without reading it into python.
+
+        :param source: File to copy from.
+        :type source: file
+        :param destination: File to copy to.
+        :type destination: file
+        :return: Whether or not the file was copied. False if sendfile is not supported.
+        :rtype: bool
+        """
+        if not hasattr(os, "sendfile"):
+            return False
+        offset = 0
+        size = os.fstat(source.fileno()).st_size
+        while offset < size:
+            try:
+                sent = os.sendfile(destination.fileno(), source.fileno(), offset, size - offset)
+            except OSError:
+                # Not all file systems support sendfile.
+                if offset == 0:
+                    return False
+                raise
+            if sent == 0:
+                break
+            offset += sent
+        return True
 
     def add_to_full_log(self, report):
         """Add text in report to the full global log.
@@ -83,11 +163,33 @@ class Workspace:
         :param report: Path the the test report generated by test case.
         :type report: :obj:`pathlib.Path`
         """
-        if report.exists():
-            full_execution = self.global_logs.joinpath("full_execution.log")
-            full_execution.touch()
-            with full_execution.open(mode="a", encoding="utf-8") as full_execution_log:
-                full_execution_log.write(report.read_text())
+        try:
+            report_file = report.open(mode="rb")
+        except FileNotFoundError:
+            return
+        with report_file, self._open_full_log() as full_log:
+            if not self._sendfile(report_file, full_log):
+                copyfileobj(report_file, full_log, length=1 << 20)
+
+    def _open_full_log(self):
+        """Open the full global log for appending.
+
+        Within the workspace context the log is kept open instead of being re-opened
+        for every test report.
+
+        :return: The opened full global log.
+        :rtype: file
+        """
+        full_execution = self.global_logs.joinpath("full_execution.log")
+        if not self._in_context:
+            # Not within the workspace context, append to the log as a one-off.
+            return full_execution.open(mode="ab")
+        if self._full_log is None:
+            # sendfile does not support O_APPEND, so seek to the end before every write.
+            self._full_log = os.open(full_execution, os.O_WRONLY | os.O_CREAT, 0o644)
+        # Tests may also write to the log in GLOBAL_LOGS, don't overwrite what they wrote.
+        os.lseek(self._full_log, 0, os.SEEK_END)
+        return open(self._full_log, mode="wb", closefd=False)
 
     @contextmanager
     def collect_logs(self, base_path):
@@ -96,22 +198,59 @@ class Workspace:
         :param base_path: Base starting path for logs.
         :type base_path: :obj:`pathlib.Path`
         """
-        log_path = base_path.joinpath("logs")
-        artifact_path = base_path.joinpath("artifacts")
-        log_path.mkdir(exist_ok=True)
-        artifact_path.mkdir(exist_ok=True)
-        # DEPRECATED: TEST_ARTIFACT_PATH is deprecated and only exists
-        # for backwards compatability.
-        environ["TEST_ARTIFACT_PATH"] = str(artifact_path)
-        environ["ARTIFACT_PATH"] = str(artifact_path)
-        environ["LOG_PATH"] = str(log_path)
-        yield
-        del environ["TEST_ARTIFACT_PATH"]
-        del environ["ARTIFACT_PATH"]
-        del environ["LOG_PATH"]
+        # Test directories are re-used, only create log directories and their
+        # environment the first time.
+        if base_path not in self._collected_dirs:
+            log_path = base_path.joinpath("logs")
+            artifact_path = base_path.joinpath("artifacts")
+            log_path.mkdir(exist_ok=True)
+            artifact_path.mkdir(exist_ok=True)
+            # DEPRECATED: TEST_ARTIFACT_PATH is deprecated and only exists
+            # for backwards compatability.
+            environment = {
+                "TEST_ARTIFACT_PATH": str(artifact_path),
+                "ARTIFACT_PATH": str(artifact_path),
+                "LOG_PATH": str(log_path),
+            }
+            self._collected_dirs[base_path] = (log_path, artifact_path, environment)
+        log_path, artifact_path, environment = self._collected_dirs[base_path]
+        saved = {key: os.environ.get(key) for key in ENVIRONMENT_KEYS}
+        os.environ.update(environment)
+        try:
+            yield
+        finally:
+            # Restore rather than delete so that nested contexts work.
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
         self.add_to_full_log(log_path.joinpath("test_output.log"))
-        self.log_area.upload_logs(self.log_area.collect(log_path))
-        self.log_area.upload_artifacts(self.log_area.collect(artifact_path))
+        self._upload(log_path, artifact_path)
+
+    def preallocate(self, identifiers):
+        """Create test directories for identifiers that are known before testing starts.
+
+        The on_create callable of :meth:`test_directory` is still called the first time
+        a preallocated test directory is entered.
+
+        :param identifiers: Identifiers to create test directories for. Identifiers
+                            that already have a test directory are skipped.
+        :type identifiers: list
+        """
+        if self.workspace is None or not self.workspace.is_dir():
+            raise FileNotFoundError("Workspace not created.")
+        for index, identifier in enumerate(identifiers, start=len(self.identifiers)):
+            if identifier in self.identifiers:
+                continue
+            directory = self.workspace.joinpath(f"test_{index:04d}")
+            try:
+                directory.mkdir()
+            except FileExistsError:
+                # Left over from an earlier run. Let test_directory create a unique one.
+                continue
+            self.identifiers[identifier] = directory
+            self._preallocated.add(identifier)
 
     @contextmanager
     def test_directory(
@@ -134,47 +273,180 @@ class Workspace:
             raise FileNotFoundError("Workspace not created.")
         try:
             self.logger.info("Getting test directory with identifier %r", identifier)
-            if self.identifiers.get(identifier) is None:
-                directory = Path(mkdtemp(dir=self.workspace))
-                self.logger.info(
-                    "Directory not found. Created %r",
-                    directory.relative_to(self.top_dir),
-                )
-                self.identifiers[identifier] = directory
-                self.logger.info(
-                    "Change directory to %r",
-                    self.identifiers.get(identifier).relative_to(self.top_dir),
-                )
-                chdir(self.identifiers.get(identifier))
+            directory = self.identifiers.get(identifier)
+            if directory is None or identifier in self._preallocated:
+                if directory is None:
+                    directory = Path(mkdtemp(dir=self.workspace))
+                    self.identifiers[identifier] = directory
+                    relative_directory = directory.relative_to(self.top_dir)
+                    self.logger.info("Directory not found. Created %r", relative_directory)
+                else:
+                    self._preallocated.discard(identifier)
+                    relative_directory = directory.relative_to(self.top_dir)
+                    self.logger.info("Using preallocated directory %r", relative_directory)
+                self.logger.info("Change directory to %r", relative_directory)
+                os.chdir(directory)
                 if on_create is not None:
                     on_create(*on_create_args)
             else:
-                self.logger.info(
-                    "Found %r",
-                    self.identifiers.get(identifier).relative_to(self.top_dir),
-                )
-                self.logger.info(
-                    "Change directory to %r",
-                    self.identifiers.get(identifier).relative_to(self.top_dir),
-                )
-                chdir(self.identifiers.get(identifier))
-            with self.collect_logs(self.identifiers.get(identifier)):
-                yield self.identifiers.get(identifier)
+                relative_directory = directory.relative_to(self.top_dir)
+                self.logger.info("Found %r", relative_directory)
+                self.logger.info("Change directory to %r", relative_directory)
+                os.chdir(directory)
+            with self.collect_logs(directory):
+                yield directory
         finally:
-            self.logger.info("Returning to %r", self.workspace.relative_to(self.top_dir))
-            chdir(self.workspace)
+            self.logger.info("Returning to %r", self._relative_workspace)
+            os.chdir(self.workspace)
+
+    def _compressor(self):
+        """Get the compressor command to pipe tar through and the resulting archive type.
+
+        Zstandard is used if requested with WORKSPACE_COMPRESSION=zstd and the zstd binary
+        is installed. Otherwise gzip is used, preferring the multi-threaded pigz.
+
+        :return: Compressor command, archive name and archive content type or None if no
+                 compressor is installed.
+        :rtype: tuple or None
+        """
+        if os.getenv("WORKSPACE_COMPRESSION", "gzip").lower() == "zstd":
+            zstd = which("zstd")
+            if zstd is not None:
+                return [zstd, "-3", "-T0", "-q", "-c"], "workspace.tar.zst", "application/zstd"
+            self.logger.warning("zstd compression requested, but zstd is not installed.")
+        pigz = which("pigz")
+        if pigz is not None:
+            return (
+                [pigz, "-p", str(os.cpu_count() or 1), "-6"],
+                "workspace.tar.gz",
+                "application/gzip",
+            )
+        gzip_binary = which("gzip")
+        if gzip_binary is not None:
+            return [gzip_binary, "-6"], "workspace.tar.gz", "application/gzip"
+        return None
+
+    @contextmanager
+    def _compression(self, tar, compressor, output):
+        """Compress the workspace by piping tar into an external compressor.
+
+        Use :meth:`_compressed` to wait for, and check, the result of the compression.
+
+        :param tar: Path to the tar binary.
+        :type tar: str
+        :param compressor: Compressor command to pipe the tar stream through.
+        :type compressor: list
+        :param output: Where to write the compressed workspace. A file or subprocess.PIPE.
+        :type output: file or int
+        :return: The tar and compressor processes.
+        :rtype: tuple
+        """
+        tar_command = [
+            tar,
+            "-cf",
+            "-",
+            "-C",
+            str(self.top_dir),
+            str(self.workspace.relative_to(self.top_dir)),
+        ]
+        with subprocess.Popen(tar_command, stdout=subprocess.PIPE) as tar_process:
+            with subprocess.Popen(
+                compressor, stdin=tar_process.stdout, stdout=output
+            ) as compress_process:
+                # Close our copy of the pipe so that tar receives SIGPIPE
+                # if the compressor exits prematurely.
+                tar_process.stdout.close()
+                yield tar_process, compress_process
+
+    def _compressed(self, tar_process, compress_process):
+        """Wait for a compression to finish and check whether it succeeded.
+
+        :param tar_process: The tar process of the compression.
+        :type tar_process: :obj:`subprocess.Popen`
+        :param compress_process: The compressor process of the compression.
+        :type compress_process: :obj:`subprocess.Popen`
+        :return: Whether or not the workspace was successfully compressed.
+        :rtype: bool
+        """
+        # Output that is left in the pipe was never uploaded. Checking this also makes
+        # sure that waiting for the compressor cannot block on a full pipe.
+        if compress_process.stdout is not None and compress_process.stdout.read(1):
+            self.logger.error("The compressed workspace was not read to the end.")
+            return False
+        compress_process.wait()
+        tar_process.wait()
+        # GNU tar exits with 1 if files changed while they were archived. The
+        # archive is still valid.
+        if tar_process.returncode == 1:
+            self.logger.warning("Some files changed while compressing the workspace.")
+        elif tar_process.returncode != 0:
+            self.logger.error("tar failed with exit code %r", tar_process.returncode)
+            return False
+        if compress_process.returncode != 0:
+            self.logger.error(
+                "%r failed with exit code %r", compress_process.args[0], compress_process.returncode
+            )
+            return False
+        return True
+
+    def upload_compressed(self):
+        """Compress the entire workspace folder and stream it to the log area.
+
+        The compressed workspace is uploaded while it is being compressed and is never
+        written to disk. If tar or gzip binaries are missing, or the streamed upload fails,
+        the workspace is compressed to disk and uploaded as a regular artifact instead.
+        """
+        if self.workspace is None or not self.workspace.is_dir():
+            raise FileNotFoundError("Workspace not created.")
+        tar = which("tar")
+        compressor = self._compressor()
+        if tar is not None and compressor is not None:
+            command, name, content_type = compressor
+            self.logger.info("Compress and upload workspace directory using %r", command[0])
+            with self._compression(tar, command, subprocess.PIPE) as processes:
+                uploaded = self.log_area.upload_stream(
+                    name,
+                    processes[1].stdout,
+                    partial(self._compressed, *processes),
+                    content_type=content_type,
+                )
+            if uploaded:
+                return
+            self.logger.warning("Failed to stream the workspace. Uploading it as a file instead.")
+        self.compress()
+        self.log_area.upload_artifacts(
+            [
+                {
+                    "name": self.compressed_workspace.name,
+                    "file": self.compressed_workspace,
+                }
+            ]
+        )
 
     def compress(self):
         """Compress the entire workspace folder."""
         if self.workspace is None or not self.workspace.is_dir():
             raise FileNotFoundError("Workspace not created.")
         self.logger.info("Compress workspace directory")
-        compressed_workspace = self.top_dir.joinpath("workspace").relative_to(Path.cwd())
-        filename = make_archive(
-            compressed_workspace,
-            format="gztar",
-            root_dir=self.top_dir.relative_to(Path.cwd()),
-            base_dir=self.workspace.relative_to(Path.cwd()),
-            logger=self.logger,
-        )
-        self.compressed_workspace = Path(filename)
+        tar = which("tar")
+        compressor = self._compressor()
+        if tar is not None and compressor is not None:
+            command, name, _ = compressor
+            self.logger.info("Compressing workspace using %r", command[0])
+            target = self.top_dir.joinpath(name)
+            with target.open(mode="wb") as archive:
+                with self._compression(tar, command, archive) as processes:
+                    if not self._compressed(*processes):
+                        raise RuntimeError(f"Could not compress workspace using {command!r}")
+            self.compressed_workspace = target
+            return
+        self.logger.info("No tar and gzip binaries found. Compressing workspace in Python.")
+        target = self.top_dir.joinpath("workspace.tar.gz")
+        # Level 9, which is the tarfile default, costs a lot of CPU for a marginally
+        # smaller archive. Use level 6, which is the default of the gzip binary.
+        # The tar is written in stream mode ("w|") through our own gzip writer since
+        # tarfile does not accept a compresslevel for streams on all python versions.
+        with gzip.open(target, mode="wb", compresslevel=6) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w|") as archive:
+                archive.add(self.workspace, arcname=self.workspace.relative_to(self.top_dir))
+        self.compressed_workspace = target
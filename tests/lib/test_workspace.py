@@ -14,18 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Workspace test module."""
+import os
+import errno
 import sys
 import logging
-from shutil import rmtree, unpack_archive
+from shutil import rmtree, unpack_archive, which
 from pathlib import Path
-from unittest import TestCase
-from unittest.mock import Mock
+from unittest import TestCase, skipIf
+from unittest.mock import Mock, patch
 from etos_test_runner.lib.workspace import Workspace
 
 logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 
 
-class TestWorkspace(TestCase):
+class TestWorkspace(TestCase):  # pylint:disable=too-many-public-methods
     """Tests for the workspace library."""
 
     workspace = None
@@ -70,16 +72,18 @@ class TestWorkspace(TestCase):
 
         Approval criteria:
             - The workspace library shall create the workspace main directory when used as context
-            - The workspace library shall attempt to compress the workspace directory when closed
+            - The workspace library shall attempt to compress and upload the workspace directory
+              when closed
 
         Test steps::
             1. Initialize the workspace library as a context manager.
             2. Verify that the workspace library created the main workspace directory.
             3. Exit the context.
-            4. Verify that the workspace library compressed the main workspace directory.
+            4. Verify that the workspace library uploaded the compressed main workspace directory.
         """
         self.logger.info("STEP: Initialize the workspace library as a context manager.")
-        with Workspace(Mock()) as workspace:
+        log_area = Mock()
+        with Workspace(log_area) as workspace:
             self.workspace = workspace
             self.logger.info(
                 "STEP: Verify that the workspace library created the main workspace directory."
@@ -88,10 +92,11 @@ class TestWorkspace(TestCase):
 
             self.logger.info("STEP: Exit the context.")
         self.logger.info(
-            "STEP: Verify that the workspace library compressed the main workspace directory."
+            "STEP: Verify that the workspace library uploaded the compressed main workspace "
+            "directory."
         )
-        compressed_workspace = Path.cwd().joinpath("workspace.tar.gz")
-        self.assertTrue(compressed_workspace.exists() and compressed_workspace.is_file())
+        log_area.upload_stream.assert_called_once()
+        self.assertEqual(log_area.upload_stream.call_args.args[0], "workspace.tar.gz")
 
     def test_compress(self):
         """Test that the compression method compresses a folder and all its subdirectories.
@@ -121,12 +126,75 @@ class TestWorkspace(TestCase):
         workspace.compress()
 
         self.logger.info("STEP: Verify that the directory was compressed using the gztar format.")
+        self.items.append(directory)
+        compressed_workspace = Path.cwd().joinpath("workspace.tar.gz")
+        unpack_archive(compressed_workspace, test_folder, format="gztar")
+        compressed_file = test_folder.joinpath("workspace/file.txt")
+        self.assertTrue(compressed_file.exists() and compressed_file.is_file())
+
+    def test_compress_without_binaries(self):
+        """Test that the compression method falls back to python if tar and gzip are missing.
+
+        Approval criteria:
+            - The compression method shall compress a folder with gztar without external binaries.
+
+        Test steps::
+            1. Create the workspace directory to be compressed.
+            2. Compress the directory without tar, pigz or gzip available.
+            3. Verify that the directory was compressed using the gztar format.
+        """
+        self.logger.info("STEP: Create the workspace directory to be compressed.")
+        self.workspace = Workspace(Mock)
+        directory = Path.cwd().joinpath("workspace")
+        directory.mkdir()
+        self.workspace.workspace = directory
+        directory.joinpath("file.txt").touch()
+
+        test_folder = Path.cwd().joinpath("testfolder")
+        test_folder.mkdir()
         self.items.append(test_folder)
+
+        self.logger.info("STEP: Compress the directory without tar, pigz or gzip available.")
+        with patch("etos_test_runner.lib.workspace.which", return_value=None):
+            self.workspace.compress()
+
+        self.logger.info("STEP: Verify that the directory was compressed using the gztar format.")
         compressed_workspace = Path.cwd().joinpath("workspace.tar.gz")
         unpack_archive(compressed_workspace, test_folder, format="gztar")
         compressed_file = test_folder.joinpath("workspace/file.txt")
         self.assertTrue(compressed_file.exists() and compressed_file.is_file())
 
+    @skipIf(which("zstd") is None, "zstd is not installed")
+    def test_compress_zstd(self):
+        """Test that the compression method compresses with zstd when configured to.
+
+        Approval criteria:
+            - The compression method shall compress a folder with zstd if WORKSPACE_COMPRESSION
+              is set to 'zstd'.
+
+        Test steps::
+            1. Create the workspace directory to be compressed.
+            2. Compress the directory with WORKSPACE_COMPRESSION set to 'zstd'.
+            3. Verify that the directory was compressed using the zstd format.
+        """
+        self.logger.info("STEP: Create the workspace directory to be compressed.")
+        self.workspace = Workspace(Mock)
+        directory = Path.cwd().joinpath("workspace")
+        directory.mkdir()
+        self.workspace.workspace = directory
+        directory.joinpath("file.txt").touch()
+
+        self.logger.info("STEP: Compress the directory with WORKSPACE_COMPRESSION set to 'zstd'.")
+        with patch.dict(os.environ, {"WORKSPACE_COMPRESSION": "zstd"}):
+            self.workspace.compress()
+
+        self.logger.info("STEP: Verify that the directory was compressed using the zstd format.")
+        compressed_workspace = Path.cwd().joinpath("workspace.tar.zst")
+        self.items.append(compressed_workspace)
+        self.assertEqual(self.workspace.compressed_workspace, compressed_workspace)
+        with compressed_workspace.open(mode="rb") as archive:
+            self.assertEqual(archive.read(4), b"\x28\xb5\x2f\xfd")
+
     def test_compress_error_when_no_workspace_exists(self):
         """Test that the compression method raises exception when no workspace exists.
 
@@ -264,3 +332,324 @@ class TestWorkspace(TestCase):
         with self.assertRaises(Exception):
             with self.workspace.test_directory("dir1"):
                 pass
+
+    def test_full_execution_log(self):
+        """Test that test reports are added to the full execution log.
+
+        Approval criteria:
+            - The workspace library shall add all test reports to the full execution log.
+
+        Test steps::
+            1. Initialize the workspace.
+            2. Write a test report in two test directories.
+            3. Exit the workspace context.
+            4. Verify that both reports were added to the full execution log.
+        """
+        self.logger.info("STEP: Initialize the workspace.")
+        with Workspace(Mock()) as workspace:
+            self.workspace = workspace
+            self.items.append(workspace.global_logs)
+            self.items.append(workspace.global_artifacts)
+
+            self.logger.info("STEP: Write a test report in two test directories.")
+            for identifier in ("dir1", "dir2"):
+                with workspace.test_directory(identifier) as directory:
+                    report = directory.joinpath("logs/test_output.log")
+                    report.write_text(f"report from {identifier}\n", encoding="utf-8")
+
+            self.logger.info("STEP: Exit the workspace context.")
+
+        self.logger.info("STEP: Verify that both reports were added to the full execution log.")
+        full_execution = workspace.global_logs.joinpath("full_execution.log")
+        self.assertEqual(
+            full_execution.read_text(encoding="utf-8"),
+            "report from dir1\nreport from dir2\n",
+        )
+
+    def test_full_execution_log_other_writers(self):
+        """Test that the full execution log does not overwrite what others write to it.
+
+        Approval criteria:
+            - The workspace library shall append test reports at the end of the full execution log.
+
+        Test steps::
+            1. Initialize the workspace.
+            2. Write a report, append to the full execution log and write another report.
+            3. Verify that nothing in the full execution log was overwritten.
+        """
+        self.logger.info("STEP: Initialize the workspace.")
+        with Workspace(Mock()) as workspace:
+            self.workspace = workspace
+            self.items.append(workspace.global_logs)
+            self.items.append(workspace.global_artifacts)
+            full_execution = workspace.global_logs.joinpath("full_execution.log")
+
+            self.logger.info(
+                "STEP: Write a report, append to the full execution log and write another report."
+            )
+            with workspace.test_directory("dir1") as directory:
+                report = directory.joinpath("logs/test_output.log")
+                report.write_text("report from dir1\n", encoding="utf-8")
+            with full_execution.open(mode="a", encoding="utf-8") as full_log:
+                full_log.write("from the test\n")
+            with workspace.test_directory("dir2") as directory:
+                report = directory.joinpath("logs/test_output.log")
+                report.write_text("report from dir2\n", encoding="utf-8")
+
+        self.logger.info("STEP: Verify that nothing in the full execution log was overwritten.")
+        self.assertEqual(
+            full_execution.read_text(encoding="utf-8"),
+            "report from dir1\nfrom the test\nreport from dir2\n",
+        )
+
+    def test_full_execution_log_no_reports(self):
+        """Test that the full execution log is not created when there are no test reports.
+
+        Approval criteria:
+            - The workspace library shall not create an empty full execution log.
+
+        Test steps::
+            1. Initialize the workspace.
+            2. Exit the workspace context without writing any test reports.
+            3. Verify that the full execution log does not exist.
+        """
+        self.logger.info("STEP: Initialize the workspace.")
+        with Workspace(Mock()) as workspace:
+            self.workspace = workspace
+            self.items.append(workspace.global_logs)
+            self.items.append(workspace.global_artifacts)
+
+            self.logger.info("STEP: Exit the workspace context without writing any test reports.")
+
+        self.logger.info("STEP: Verify that the full execution log does not exist.")
+        self.assertFalse(workspace.global_logs.joinpath("full_execution.log").exists())
+
+    def test_test_directory_no_logs_to_collect(self):
+        """Test that logs and artifacts are only collected when there are any.
+
+        Approval criteria:
+            - The workspace library shall not collect logs nor artifacts from empty directories.
+
+        Test steps::
+            1. Initialize the workspace.
+            2. Enter and exit a test directory without creating any logs or artifacts.
+            3. Verify that no logs nor artifacts were collected.
+        """
+        self.logger.info("STEP: Initialize the workspace.")
+        log_area = Mock()
+        with Workspace(log_area) as workspace:
+            self.workspace = workspace
+
+            self.logger.info(
+                "STEP: Enter and exit a test directory without creating any logs or artifacts."
+            )
+            with workspace.test_directory("dir1"):
+                pass
+
+            self.logger.info("STEP: Verify that no logs nor artifacts were collected.")
+            log_area.collect.assert_not_called()
+            log_area.upload_logs.assert_not_called()
+            log_area.upload_artifacts.assert_not_called()
+
+    def test_preallocate(self):
+        """Test that preallocated test directories are used by test directory.
+
+        Approval criteria:
+            - The workspace library shall create test directories for preallocated identifiers.
+            - The workspace library shall call on_create the first time a preallocated test
+              directory is entered.
+
+        Test steps::
+            1. Initialize the workspace.
+            2. Preallocate test directories for two identifiers.
+            3. Verify that the test directories were created.
+            4. Enter a preallocated test directory twice with a method call registered.
+            5. Verify that the preallocated directory was used and the method called once.
+        """
+        calls = []
+
+        def callee(calls):
+            """Test function for counting calls."""
+            calls.append(1)
+
+        self.logger.info("STEP: Initialize the workspace.")
+        with Workspace(Mock()) as workspace:
+            self.workspace = workspace
+
+            self.logger.info("STEP: Preallocate test directories for two identifiers.")
+            workspace.preallocate(["dir1", "dir2", "dir1"])
+
+            self.logger.info("STEP: Verify that the test directories were created.")
+            self.assertEqual(len(workspace.identifiers), 2)
+            for directory in workspace.identifiers.values():
+                self.assertTrue(directory.exists() and directory.is_dir())
+            preallocated = workspace.identifiers["dir1"]
+
+            self.logger.info(
+                "STEP: Enter a preallocated test directory twice with a method call registered."
+            )
+            for _ in range(2):
+                with workspace.test_directory("dir1", callee, calls) as directory:
+                    self.logger.info(
+                        "STEP: Verify that the preallocated directory was used and the method "
+                        "called once."
+                    )
+                    self.assertEqual(directory, preallocated)
+                    self.assertEqual(len(calls), 1)
+
+    def test_context_stream_upload_failure(self):
+        """Test that the workspace is uploaded as a file if streaming it fails.
+
+        Approval criteria:
+            - The workspace library shall upload the compressed workspace as a regular
+              artifact if the streamed upload fails.
+
+        Test steps::
+            1. Initialize the workspace library as a context manager with a failing stream upload.
+            2. Exit the context.
+            3. Verify that the compressed workspace was uploaded as an artifact.
+        """
+        self.logger.info(
+            "STEP: Initialize the workspace library as a context manager with a failing stream "
+            "upload."
+        )
+        log_area = Mock()
+        log_area.upload_stream.return_value = False
+        with Workspace(log_area) as workspace:
+            self.workspace = workspace
+            self.items.append(workspace.global_logs)
+            self.items.append(workspace.global_artifacts)
+            self.logger.info("STEP: Exit the context.")
+
+        self.logger.info("STEP: Verify that the compressed workspace was uploaded as an artifact.")
+        compressed_workspace = Path.cwd().joinpath("workspace.tar.gz")
+        log_area.upload_artifacts.assert_called_once_with(
+            [{"name": "workspace.tar.gz", "file": compressed_workspace}]
+        )
+        self.assertTrue(compressed_workspace.is_file())
+
+    def test_full_execution_log_without_context(self):
+        """Test that test reports are added to the full execution log outside of the context.
+
+        Approval criteria:
+            - The workspace library shall add test reports to the full execution log when
+              the workspace was not entered as a context manager.
+
+        Test steps::
+            1. Create the workspace directory without entering the workspace context.
+            2. Write a test report in a test directory.
+            3. Verify that the report was added to the full execution log.
+        """
+        self.logger.info(
+            "STEP: Create the workspace directory without entering the workspace context."
+        )
+        self.workspace = Workspace(Mock())
+        directory = Path.cwd().joinpath("workspace")
+        directory.mkdir()
+        self.workspace.workspace = directory
+        self.workspace.global_logs.mkdir(exist_ok=True)
+        self.items.append(self.workspace.global_logs)
+
+        self.logger.info("STEP: Write a test report in a test directory.")
+        try:
+            with self.workspace.test_directory("dir1") as test_directory:
+                report = test_directory.joinpath("logs/test_output.log")
+                report.write_text("report\n", encoding="utf-8")
+        finally:
+            os.chdir(self.workspace.top_dir)
+
+        self.logger.info("STEP: Verify that the report was added to the full execution log.")
+        full_execution = self.workspace.global_logs.joinpath("full_execution.log")
+        self.assertEqual(full_execution.read_text(encoding="utf-8"), "report\n")
+
+    def test_test_directory_restores_environment(self):
+        """Test that test directory restores the environment variables it sets.
+
+        Approval criteria:
+            - The workspace library shall restore LOG_PATH after a test directory context.
+            - The workspace library shall restore LOG_PATH if the test directory context fails.
+
+        Test steps::
+            1. Initialize the workspace with LOG_PATH set.
+            2. Enter and exit a test directory.
+            3. Verify that LOG_PATH was restored.
+            4. Enter a test directory and raise an exception within it.
+            5. Verify that LOG_PATH was restored.
+        """
+        self.logger.info("STEP: Initialize the workspace with LOG_PATH set.")
+        with patch.dict(os.environ, {"LOG_PATH": "/outer/logs"}):
+            with Workspace(Mock()) as workspace:
+                self.workspace = workspace
+
+                self.logger.info("STEP: Enter and exit a test directory.")
+                with workspace.test_directory("dir1") as directory:
+                    self.assertEqual(os.environ["LOG_PATH"], str(directory.joinpath("logs")))
+
+                self.logger.info("STEP: Verify that LOG_PATH was restored.")
+                self.assertEqual(os.environ["LOG_PATH"], "/outer/logs")
+
+                self.logger.info("STEP: Enter a test directory and raise an exception within it.")
+                with self.assertRaises(RuntimeError):
+                    with workspace.test_directory("dir1"):
+                        raise RuntimeError("Test failed")
+
+                self.logger.info("STEP: Verify that LOG_PATH was restored.")
+                self.assertEqual(os.environ["LOG_PATH"], "/outer/logs")
+
+    def test_full_execution_log_without_sendfile(self):
+        """Test that test reports are added to the full execution log if sendfile fails.
+
+        Approval criteria:
+            - The workspace library shall add test reports to the full execution log when
+              sendfile is not supported.
+
+        Test steps::
+            1. Initialize the workspace.
+            2. Write a test report in a test directory with a failing sendfile.
+            3. Verify that the report was added to the full execution log.
+        """
+        self.logger.info("STEP: Initialize the workspace.")
+        with Workspace(Mock()) as workspace:
+            self.workspace = workspace
+            self.items.append(workspace.global_logs)
+            self.items.append(workspace.global_artifacts)
+
+            self.logger.info(
+                "STEP: Write a test report in a test directory with a failing sendfile."
+            )
+            with patch("os.sendfile", side_effect=OSError(errno.EINVAL, "Invalid argument")):
+                with workspace.test_directory("dir1") as directory:
+                    report = directory.joinpath("logs/test_output.log")
+                    report.write_text("report\n", encoding="utf-8")
+
+        self.logger.info("STEP: Verify that the report was added to the full execution log.")
+        full_execution = workspace.global_logs.joinpath("full_execution.log")
+        self.assertEqual(full_execution.read_text(encoding="utf-8"), "report\n")
+
+    def test_preallocate_directory_exists(self):
+        """Test that preallocation continues after a directory that already exists.
+
+        Approval criteria:
+            - The workspace library shall preallocate directories for identifiers following
+              an identifier whose directory already exists.
+
+        Test steps::
+            1. Initialize the workspace with a left over test directory.
+            2. Preallocate test directories for two identifiers.
+            3. Verify that only the second identifier got a preallocated directory.
+        """
+        self.logger.info("STEP: Initialize the workspace with a left over test directory.")
+        with Workspace(Mock()) as workspace:
+            self.workspace = workspace
+            workspace.workspace.joinpath("test_0000").mkdir()
+
+            self.logger.info("STEP: Preallocate test directories for two identifiers.")
+            workspace.preallocate(["dir1", "dir2"])
+
+            self.logger.info(
+                "STEP: Verify that only the second identifier got a preallocated directory."
+            )
+            self.assertNotIn("dir1", workspace.identifiers)
+            self.assertEqual(
+                workspace.identifiers.get("dir2"), workspace.workspace.joinpath("test_0001")
+            )
@@ -15,9 +15,11 @@
 # limitations under the License.
 """Tests full executions."""
 import os
+import json
 import logging
 from copy import deepcopy
 from shutil import rmtree
+from collections.abc import Iterator
 from contextlib import contextmanager
 from pathlib import Path
 from unittest import TestCase
@@ -80,6 +82,7 @@ SUITE = {
         "logs": {},
     },
 }
+SUITE_JSON = json.dumps(SUITE)
 
 
 class TestLogUpload(TestCase):
@@ -110,7 +113,7 @@ class TestLogUpload(TestCase):
         patcher = patch("etos_lib.etos.Http.wait_for_request")
         self.patchers.append(patcher)
         self.wait_for_request = patcher.start()
-        self.suite = deepcopy(SUITE)
+        self.suite = json.loads(SUITE_JSON)
         self.wait_for_request.return_value = [self.suite]
 
     def _patch_http_request(self):
@@ -118,7 +121,15 @@ class TestLogUpload(TestCase):
         patcher = patch("etos_lib.etos.Http.request")
         self.patchers.append(patcher)
         self.http_request = patcher.start()
-        self.http_request.return_value = True
+
+        def request(*_, data=None, **__):
+            """Consume streamed data, like a real request would."""
+            if data is not None and not hasattr(data, "read"):
+                for _ in data:
+                    pass
+            return True
+
+        self.http_request.side_effect = request
 
     def tearDown(self):
         """Clear the test folder and patchers."""
@@ -211,7 +222,14 @@ class TestLogUpload(TestCase):
             for method_call in self.http_request.call_args_list:
                 verb, url, as_json = method_call.args
                 data = method_call.kwargs.get("data")
-                filename = Path(data.name)
+                # The workspace is streamed and has no file name, use the URL instead.
+                filename = Path(getattr(data, "name", url))
+                if filename.name == "workspace.tar.gz":
+                    self.assertIsInstance(data, Iterator)
+                    self.assertFalse(hasattr(data, "read"))
+                    self.assertEqual(
+                        method_call.kwargs.get("headers"), {"Content-Type": "application/gzip"}
+                    )
 
                 self.assertEqual(verb, self.suite["log_area"]["upload"]["method"])
                 self.assertEqual(
@@ -374,6 +392,86 @@ class TestLogUpload(TestCase):
                     expected.remove(log)
             self.assertEqual(len(expected), 0)
 
+    def test_log_and_artifact_with_same_name(self):
+        """Test that a log and an artifact with the same name are both uploaded.
+
+        Approval criteria:
+            - A test artifact shall be renamed if a test log has the same name.
+
+        Test steps::
+            1. Initialize ETR.
+            2. Run ETR with a test suite that creates a log and an artifact with the same name.
+            3. Verify that both files were uploaded with different names.
+        """
+        environment = {
+            "ETOS_DISABLE_SENDING_EVENTS": "1",
+            "ETOS_DISABLE_RECEIVING_EVENTS": "1",
+            "ETOS_GRAPHQL_SERVER": "http://localhost/graphql",
+            "SUB_SUITE_URL": "http://localhost/download_suite",
+            "HOME": self.root,  # There is something weird with tox and HOME. This fixes it.
+        }
+        command_index = self.suite["recipes"][0]["constraints"].index(
+            {"key": "COMMAND", "value": "exit 0"}
+        )
+        self.suite["recipes"][0]["constraints"][command_index] = {
+            "key": "COMMAND",
+            "value": "touch $LOG_PATH/my_file.txt $ARTIFACT_PATH/my_file.txt",
+        }
+        with self.environ(environment):
+            self.logger.info("STEP: Initialize ETR.")
+            etr = ETR()
+
+            self.logger.info(
+                "STEP: Run ETR with a test suite that creates a log and an artifact with the "
+                "same name."
+            )
+            etr.run_etr()
+
+            self.logger.info("STEP: Verify that both files were uploaded with different names.")
+            uploaded = [Path(call.args[1]).name for call in self.http_request.call_args_list]
+            self.assertEqual(uploaded.count("ETOS_API_functests_my_file.txt"), 1)
+            self.assertEqual(uploaded.count("1_ETOS_API_functests_my_file.txt"), 1)
+
+    def test_global_log_and_artifact_with_same_name(self):
+        """Test that a global log and a global artifact with the same name are both uploaded.
+
+        Approval criteria:
+            - A global artifact shall be renamed if a global log has the same name.
+
+        Test steps::
+            1. Initialize ETR.
+            2. Run ETR with a test suite that creates a global artifact named as the full log.
+            3. Verify that both files were uploaded with different names.
+        """
+        environment = {
+            "ETOS_DISABLE_SENDING_EVENTS": "1",
+            "ETOS_DISABLE_RECEIVING_EVENTS": "1",
+            "ETOS_GRAPHQL_SERVER": "http://localhost/graphql",
+            "SUB_SUITE_URL": "http://localhost/download_suite",
+            "HOME": self.root,  # There is something weird with tox and HOME. This fixes it.
+        }
+        command_index = self.suite["recipes"][0]["constraints"].index(
+            {"key": "COMMAND", "value": "exit 0"}
+        )
+        self.suite["recipes"][0]["constraints"][command_index] = {
+            "key": "COMMAND",
+            "value": "echo artifact > $GLOBAL_ARTIFACTS/full_execution.log",
+        }
+        with self.environ(environment):
+            self.logger.info("STEP: Initialize ETR.")
+            etr = ETR()
+
+            self.logger.info(
+                "STEP: Run ETR with a test suite that creates a global artifact named as the "
+                "full log."
+            )
+            etr.run_etr()
+
+            self.logger.info("STEP: Verify that both files were uploaded with different names.")
+            uploaded = [Path(call.args[1]).name for call in self.http_request.call_args_list]
+            self.assertEqual(uploaded.count("full_execution.log"), 1)
+            self.assertEqual(uploaded.count("1_full_execution.log"), 1)
+
     def test_artifact_upload(self):
         """Test that artifact upload works as expected.
 
@@ -417,7 +515,8 @@ class TestLogUpload(TestCase):
             for method_call in self.http_request.call_args_list:
                 verb, url, as_json = method_call.args
                 data = method_call.kwargs.get("data")
-                filename = Path(data.name)
+                # The workspace is streamed and has no file name, use the URL instead.
+                filename = Path(getattr(data, "name", url))
                 if filename.name == artifact:
                     self.assertEqual(verb, self.suite["log_area"]["upload"]["method"])
                     self.assertEqual(
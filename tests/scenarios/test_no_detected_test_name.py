@@ -15,8 +15,8 @@
 # limitations under the License.
 """Tests full executions."""
 import os
+import json
 import logging
-from copy import deepcopy
 from shutil import rmtree
 from contextlib import contextmanager
 from pathlib import Path
@@ -95,6 +95,7 @@ SUITE = {
         "logs": {},
     },
 }
+SUITE_JSON = json.dumps(SUITE)
 
 
 # pylint:disable=too-many-instance-attributes
@@ -114,7 +115,7 @@ class TestFullExecution(TestCase):
         patcher = patch("etos_lib.etos.Http.wait_for_request")
         self.patchers.append(patcher)
         self.wait_for_request = patcher.start()
-        self.suite = deepcopy(SUITE)
+        self.suite = json.loads(SUITE_JSON)
         self.wait_for_request.return_value = [self.suite]
 
     def _patch_http_request(self):